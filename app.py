@@ -1,4 +1,18 @@
 # -*- coding: utf-8 -*-
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from numba import njit
+import plotly.io as pio
+from plotly.colors import qualitative
+import dash_bootstrap_components as dbc
+from dash import Dash, html, dcc, Input, Output, State
+from flask_caching import Cache
+
 # --- Leitura das bases de dados ---
 
 # Lista dos arquivos de vendas
@@ -8,50 +22,127 @@ arquivos_vendas = [
     '/content/Base Vendas - 2022.xlsx'
 ]
 
-# Padronizando colunas das vendas
-colunas_vendas = ['Data da Venda', 'Ordem de Compra', 'ID Produto', 'ID Cliente', 'Qtd Vendida', 'ID Loja']
-
-# Carregando e padronizando cada base de vendas
-lista_vendas = []
-for arquivo in arquivos_vendas:
-    df_temp = pd.read_excel(arquivo)
-    df_temp.columns = colunas_vendas
-    lista_vendas.append(df_temp)
-
-# Concatenar todas as vendas
-df_vendas = pd.concat(lista_vendas, ignore_index=True)
-
-# Leitura cadastros
-df_clientes = pd.read_excel('/content/Cadastro Clientes.xlsx', skiprows=2)
-df_produtos = pd.read_excel('/content/Cadastro Produtos.xlsx')
-df_lojas = pd.read_excel('/content/Cadastro Lojas.xlsx')
+# Arquivos de cadastro
+arquivo_clientes = '/content/Cadastro Clientes.xlsx'
+arquivo_produtos = '/content/Cadastro Produtos.xlsx'
+arquivo_lojas = '/content/Cadastro Lojas.xlsx'
 
-# --- Tratamento dos dados ---
+# Cache do dataframe final em Arrow IPC, salvo ao lado das bases
+arquivo_cache = os.path.join(os.path.dirname(arquivo_clientes), 'df_total.arrow')
 
-# Unificar nome completo dos clientes
-if 'Primeiro Nome' in df_clientes.columns and 'Sobrenome' in df_clientes.columns:
-    df_clientes['Nome Completo'] = df_clientes['Primeiro Nome'].astype(str) + ' ' + df_clientes['Sobrenome'].astype(str)
-    df_clientes.drop(columns=['Primeiro Nome', 'Sobrenome'], inplace=True)
+# Versão do cache, gravada nos metadados do arquivo: incrementar sempre que
+# build_df_total mudar as colunas ou os tipos do dataframe final
+CACHE_VERSION = '1'
 
-# Renomear coluna SKU para ID Produto em produtos, se existir
-if 'SKU' in df_produtos.columns:
-    df_produtos.rename(columns={'SKU': 'ID Produto'}, inplace=True)
-
-# Garantir que a coluna 'ID Produto' também esteja no df_vendas
-if 'SKU' in df_vendas.columns:
-    df_vendas.rename(columns={'SKU': 'ID Produto'}, inplace=True)
-
-# Converter 'Data da Venda' para datetime
-df_vendas['Data da Venda'] = pd.to_datetime(df_vendas['Data da Venda'], dayfirst=True, errors='coerce')
-
-# Mesclar todas as informações para o dataframe final
-df_total = df_vendas.merge(df_clientes, on='ID Cliente', how='left') \
-                   .merge(df_produtos, on='ID Produto', how='left') \
-                   .merge(df_lojas, on='ID Loja', how='left')
+# Padronizando colunas das vendas
+colunas_vendas = ['Data da Venda', 'Ordem de Compra', 'ID Produto', 'ID Cliente', 'Qtd Vendida', 'ID Loja']
 
-# Criar colunas auxiliares
-df_total['Ano'] = df_total['Data da Venda'].dt.year
-df_total['Valor da Venda'] = df_total['Qtd Vendida'] * df_total['Preço Unitario']
+# Colunas usadas nos filtros e agrupamentos, armazenadas como category
+colunas_categoricas = ['Tipo do Produto', 'Marca', 'Produto', 'Nome da Loja', 'Nome Completo',
+                       'ID Produto', 'ID Cliente', 'ID Loja', 'Ano']
+
+
+def build_df_total():
+    """Lê as planilhas, trata os dados e retorna o dataframe final."""
+    # Ler todas as planilhas em paralelo (os arquivos são independentes)
+    leituras = {arquivo: {} for arquivo in arquivos_vendas}
+    leituras[arquivo_clientes] = {'skiprows': 2}
+    leituras[arquivo_produtos] = {}
+    leituras[arquivo_lojas] = {}
+
+    with ThreadPoolExecutor(max_workers=len(leituras)) as ex:
+        futures = {arquivo: ex.submit(pd.read_excel, arquivo, engine='calamine', **kw) for arquivo, kw in leituras.items()}
+        planilhas = {arquivo: f.result() for arquivo, f in futures.items()}
+
+    # Padronizando cada base de vendas
+    lista_vendas = []
+    for arquivo in arquivos_vendas:
+        df_temp = planilhas[arquivo]
+        df_temp.columns = colunas_vendas
+        lista_vendas.append(df_temp)
+
+    # Concatenar todas as vendas coluna a coluna em arrays pré-alocados
+    n = sum(len(d) for d in lista_vendas)
+    colunas = {}
+    for c in colunas_vendas:
+        partes = [d[c].to_numpy() for d in lista_vendas]
+        colunas[c] = np.empty(n, dtype=np.result_type(*partes))
+        np.concatenate(partes, out=colunas[c])
+    df_vendas = pd.DataFrame(colunas, copy=False)
+
+    # Cadastros
+    df_clientes = planilhas[arquivo_clientes]
+    df_produtos = planilhas[arquivo_produtos]
+    df_lojas = planilhas[arquivo_lojas]
+
+    # --- Tratamento dos dados ---
+
+    # Unificar nome completo dos clientes
+    if 'Primeiro Nome' in df_clientes.columns and 'Sobrenome' in df_clientes.columns:
+        df_clientes['Nome Completo'] = df_clientes['Primeiro Nome'].astype(str) + ' ' + df_clientes['Sobrenome'].astype(str)
+        df_clientes.drop(columns=['Primeiro Nome', 'Sobrenome'], inplace=True)
+
+    # Renomear coluna SKU para ID Produto em produtos, se existir
+    if 'SKU' in df_produtos.columns:
+        df_produtos.rename(columns={'SKU': 'ID Produto'}, inplace=True)
+
+    # Garantir que a coluna 'ID Produto' também esteja no df_vendas
+    if 'SKU' in df_vendas.columns:
+        df_vendas.rename(columns={'SKU': 'ID Produto'}, inplace=True)
+
+    # Converter 'Data da Venda' para datetime
+    df_vendas['Data da Venda'] = pd.to_datetime(df_vendas['Data da Venda'], dayfirst=True, errors='coerce')
+
+    # Mesclar todas as informações para o dataframe final (join pelo índice dos cadastros)
+    df_total = df_vendas.join(df_clientes.set_index('ID Cliente'), on='ID Cliente') \
+                       .join(df_produtos.set_index('ID Produto'), on='ID Produto') \
+                       .join(df_lojas.set_index('ID Loja'), on='ID Loja')
+
+    # Criar colunas auxiliares
+    df_total['Ano'] = df_total['Data da Venda'].dt.year
+    df_total['Mês'] = df_total['Data da Venda'].dt.to_period('M').astype(str).astype('category')
+
+    # Tipos numéricos menores reduzem a memória percorrida nos agrupamentos
+    df_total['Qtd Vendida'] = pd.to_numeric(df_total['Qtd Vendida'], downcast='integer')
+    df_total['Preço Unitario'] = df_total['Preço Unitario'].astype('float32')
+    df_total['Valor da Venda'] = df_total.eval('`Qtd Vendida` * `Preço Unitario`', engine='numexpr')
+
+    # Converter colunas de filtro para category (comparações e groupby por código)
+    for c in colunas_categoricas:
+        df_total[c] = df_total[c].astype('category')
+
+    return df_total
+
+
+def read_cache(cache):
+    """Abre o cache Arrow via mmap; as colunas numéricas ficam no page cache do SO,
+    compartilhado entre os workers do gunicorn."""
+    tabela = pa.ipc.open_file(pa.memory_map(cache)).read_all()
+    return tabela.to_pandas(split_blocks=True)
+
+
+def cache_valido(cache, paths):
+    """O cache vale se existir, for da versão atual e mais novo que todas as planilhas."""
+    if not os.path.exists(cache) or os.path.getmtime(cache) < max(os.path.getmtime(p) for p in paths):
+        return False
+    metadados = pa.ipc.open_file(pa.memory_map(cache)).schema.metadata or {}
+    return metadados.get(b'cache_version') == CACHE_VERSION.encode()
+
+
+def load_or_build_cache(paths, cache=arquivo_cache):
+    """Usa o cache Arrow se ele for válido; senão reconstrói a partir das planilhas."""
+    if not cache_valido(cache, paths):
+        tabela = pa.Table.from_pandas(build_df_total(), preserve_index=False)
+        tabela = tabela.replace_schema_metadata({**tabela.schema.metadata, b'cache_version': CACHE_VERSION.encode()})
+        # Grava em arquivo temporário e troca de uma vez, caso vários workers reconstruam juntos
+        temporario = f'{cache}.{os.getpid()}.tmp'
+        with pa.OSFile(temporario, 'wb') as sink, pa.ipc.new_file(sink, tabela.schema) as writer:
+            writer.write_table(tabela)
+        os.replace(temporario, cache)
+    return read_cache(cache)
+
+
+df_total = load_or_build_cache(arquivos_vendas + [arquivo_clientes, arquivo_produtos, arquivo_lojas])
 
 # --- Preparação dos filtros para o dashboard ---
 
@@ -63,18 +154,122 @@ filtros = {
     "cliente": df_total["Nome Completo"].dropna().unique(),
 }
 
+# Opções dos dropdowns, montadas uma única vez
+OPTIONS_TIPO = [{'label': i, 'value': i} for i in sorted(filtros['tipo'])]
+OPTIONS_PRODUTO = [{'label': i, 'value': i} for i in sorted(filtros['produto'])]
+OPTIONS_LOJA = [{'label': i, 'value': i} for i in sorted(filtros['loja'])]
+OPTIONS_CLIENTE = [{'label': i, 'value': i} for i in sorted(filtros['cliente'])]
+
+# Máximo de clientes devolvidos por busca no dropdown
+LIMITE_BUSCA_CLIENTE = 50
+
+# Marcas disponíveis para cada tipo de produto
+MARCAS_POR_TIPO = {
+    t: sorted(g['Marca'].dropna().unique().tolist())
+    for t, g in df_total.groupby('Tipo do Produto', observed=True)
+}
+
+# --- Agregações dos gráficos ---
+
+# Pool compartilhado para calcular as agregações dos gráficos em paralelo
+executor_agregacoes = ThreadPoolExecutor(max_workers=6)
+
+# Os kernels são seriais: a concorrência vem do pool acima, e kernels parallel=True
+# chamados de várias threads derrubam o processo na camada workqueue do Numba
+@njit(cache=True, nogil=True)
+def groupby_sum(codes, values, n_groups):
+    """Soma `values` por código de grupo em uma única passada.
+
+    Códigos negativos (NaN) são ignorados. Retorna as somas e a quantidade
+    de linhas de cada grupo.
+    """
+    sums = np.zeros(n_groups)
+    counts = np.zeros(n_groups, dtype=np.int64)
+    for i in range(codes.size):
+        c = codes[i]
+        if c >= 0:
+            counts[c] += 1
+            if not np.isnan(values[i]):
+                sums[c] += values[i]
+    return sums, counts
+
+
+@njit(cache=True, nogil=True)
+def groupby_sum_topk(codes, values, n_groups, k):
+    """Soma `values` por código de grupo e retorna os k grupos de maior soma.
+
+    Equivale a groupby().sum().nlargest(k) sem ordenar todos os grupos:
+    empates mantêm a ordem dos grupos.
+    """
+    sums, counts = groupby_sum(codes, values, n_groups)
+
+    observados = np.nonzero(counts)[0]
+    if observados.size > k:
+        limite = -np.partition(-sums[observados], k - 1)[k - 1]
+        observados = observados[sums[observados] >= limite]
+    ordem = np.argsort(-sums[observados], kind='mergesort')[:k]
+    idx = observados[ordem]
+    return idx, sums[idx]
+
+
+def top_vendas(df, coluna, k=10):
+    """Retorna as k maiores somas de 'Valor da Venda' por `coluna` (categórica)."""
+    categorias = df[coluna].cat.categories
+    idx, sums = groupby_sum_topk(
+        df[coluna].cat.codes.to_numpy(),
+        df['Valor da Venda'].to_numpy(),
+        len(categorias), k
+    )
+    return pd.DataFrame({coluna: categorias[idx], 'Valor da Venda': sums})
+
+
+def soma_vendas(df, coluna):
+    """Soma 'Valor da Venda' por `coluna` (categórica), só com os grupos presentes."""
+    categorias = df[coluna].cat.categories
+    sums, counts = groupby_sum(
+        df[coluna].cat.codes.to_numpy(),
+        df['Valor da Venda'].to_numpy(),
+        len(categorias)
+    )
+    observados = np.nonzero(counts)[0]
+    return pd.DataFrame({coluna: categorias[observados], 'Valor da Venda': sums[observados]})
+
+def filtrar_vendas(tipo, marca, produtos, lojas, clientes):
+    """Aplica os filtros selecionados sobre as vendas."""
+    # Combinar todos os filtros em uma única máscara e selecionar uma vez
+    mask = np.ones(len(df_total), dtype=bool)
+
+    if tipo:
+        mask &= (df_total['Tipo do Produto'] == tipo).to_numpy()
+    if marca:
+        mask &= (df_total['Marca'] == marca).to_numpy()
+    if produtos:
+        mask &= df_total['Produto'].isin(produtos).to_numpy()
+    if lojas:
+        mask &= df_total['Nome da Loja'].isin(lojas).to_numpy()
+    if clientes:
+        mask &= df_total['Nome Completo'].isin(clientes).to_numpy()
+
+    return df_total.loc[mask]
+
 # --- Montagem do dashboard com Dash e Bootstrap ---
 
 app = Dash(__name__, external_stylesheets=[dbc.themes.CYBORG])
 server = app.server
 
+# Tema dos gráficos serializado uma vez; as figuras são devolvidas como dicts
+TEMPLATE_ESCURO = pio.templates['plotly_dark'].to_plotly_json()
+
+# Cache em memória das agregações, indexado pelos valores dos filtros
+cache = Cache(server, config={'CACHE_TYPE': 'SimpleCache', 'CACHE_DEFAULT_TIMEOUT': 300})
+
 app.layout = dbc.Container([
     html.H1("📊 Dashboard de Vendas", className="text-center my-4"),
 
     dbc.Row([
         dbc.Col(dcc.Dropdown(
             id='filtro_tipo',
-            options=[{'label': i, 'value': i} for i in sorted(filtros['tipo'])],
+            options=OPTIONS_TIPO,
             placeholder="Selecione o Tipo de Produto"
         ), md=4),
 
@@ -85,23 +280,23 @@ app.layout = dbc.Container([
 
         dbc.Col(dcc.Dropdown(
             id='filtro_produto',
-            options=[{'label': i, 'value': i} for i in sorted(filtros['produto'])],
+            options=OPTIONS_PRODUTO,
             multi=True,
             placeholder="Filtrar por Produto"
         ), md=4),
 
         dbc.Col(dcc.Dropdown(
             id='filtro_loja',
-            options=[{'label': i, 'value': i} for i in sorted(filtros['loja'])],
+            options=OPTIONS_LOJA,
             multi=True,
             placeholder="Filtrar por Loja"
         ), md=4),
 
         dbc.Col(dcc.Dropdown(
             id='filtro_cliente',
-            options=[{'label': i, 'value': i} for i in sorted(filtros['cliente'])],
+            options=[],
             multi=True,
-            placeholder="Filtrar por Cliente"
+            placeholder="Filtrar por Cliente (digite para buscar)"
         ), md=4),
     ], className="mb-4"),
 
@@ -125,10 +320,54 @@ app.layout = dbc.Container([
     Input('filtro_tipo', 'value')
 )
 def atualizar_marcas(tipo):
-    if tipo:
-        marcas = df_total[df_total['Tipo do Produto'] == tipo]['Marca'].dropna().unique()
-        return [{'label': m, 'value': m} for m in sorted(marcas)]
-    return []
+    return [{'label': m, 'value': m} for m in MARCAS_POR_TIPO.get(tipo, [])]
+
+# Buscar clientes no servidor em vez de enviar a lista completa ao navegador
+@app.callback(
+    Output('filtro_cliente', 'options'),
+    Input('filtro_cliente', 'search_value'),
+    State('filtro_cliente', 'value')
+)
+def buscar_clientes(busca, selecionados):
+    # Os clientes já selecionados precisam continuar entre as opções
+    selecionados = set(selecionados or [])
+    opcoes = [o for o in OPTIONS_CLIENTE if o['value'] in selecionados]
+
+    if busca:
+        busca = busca.casefold()
+        encontrados = (o for o in OPTIONS_CLIENTE
+                       if o['value'] not in selecionados and o['label'].casefold().startswith(busca))
+        opcoes += list(islice(encontrados, LIMITE_BUSCA_CLIENTE))
+
+    return opcoes
+
+def layout_grafico(titulo, titulo_x=None, titulo_y=None):
+    """Layout em dict puro (sem validação do plotly) com o tema escuro já resolvido."""
+    layout = {'title': {'text': titulo}, 'template': TEMPLATE_ESCURO}
+    if titulo_x:
+        layout['xaxis'] = {'title': {'text': titulo_x}}
+    if titulo_y:
+        layout['yaxis'] = {'title': {'text': titulo_y}}
+    return layout
+
+@cache.memoize()
+def agregar_vendas(tipo, marca, produtos, lojas, clientes):
+    """Filtra as vendas e calcula as tabelas de cada gráfico (com cache)."""
+    df = filtrar_vendas(tipo, marca, produtos, lojas, clientes)
+
+    # As seis agregações são independentes e os kernels Numba liberam o GIL
+    tarefas = [
+        (soma_vendas, 'Ano'),
+        (top_vendas, 'Nome Completo'),
+        (top_vendas, 'Produto'),
+        (soma_vendas, 'Nome da Loja'),
+        (soma_vendas, 'Tipo do Produto'),
+        (soma_vendas, 'Mês'),
+    ]
+    futures = [executor_agregacoes.submit(fn, df, coluna) for fn, coluna in tarefas]
+
+    # vendas_ano, top_clientes, top_produtos, vendas_lojas, vendas_tipo, vendas_mes
+    return tuple(f.result() for f in futures)
 
 # Atualizar gráficos conforme filtros selecionados
 @app.callback(
@@ -145,82 +384,60 @@ def atualizar_marcas(tipo):
      Input('filtro_cliente', 'value')]
 )
 def atualizar_graficos(tipo, marca, produtos, lojas, clientes):
-    df = df_total.copy()
-
-    if tipo:
-        df = df[df['Tipo do Produto'] == tipo]
-    if marca:
-        df = df[df['Marca'] == marca]
-    if produtos:
-        df = df[df['Produto'].isin(produtos)]
-    if lojas:
-        df = df[df['Nome da Loja'].isin(lojas)]
-    if clientes:
-        df = df[df['Nome Completo'].isin(clientes)]
-
-    # Garantir que a coluna 'Data da Venda' é datetime
-    df['Data da Venda'] = pd.to_datetime(df['Data da Venda'], errors='coerce')
+    # Seleções múltiplas viram tuplas ordenadas para servir de chave do cache
+    vendas_ano, top_clientes, top_produtos, vendas_lojas, vendas_tipo, vendas_mes = agregar_vendas(
+        tipo, marca,
+        tuple(sorted(produtos or [])),
+        tuple(sorted(lojas or [])),
+        tuple(sorted(clientes or []))
+    )
 
     # Gráfico 1 - Vendas por Ano
-    fig1 = px.bar(
-        df.groupby('Ano')['Valor da Venda'].sum().reset_index(),
-        x='Ano', y='Valor da Venda',
-        title='Vendas por Ano',
-        color_discrete_sequence=['#00BFFF'],
-        template='plotly_dark'
-    )
+    fig1 = {
+        'data': [{'type': 'bar',
+                  'x': vendas_ano['Ano'].tolist(), 'y': vendas_ano['Valor da Venda'].tolist(),
+                  'marker': {'color': '#00BFFF'}}],
+        'layout': layout_grafico('Vendas por Ano', 'Ano', 'Valor da Venda')
+    }
 
     # Gráfico 2 - Top 10 Clientes
-    top_clientes = df.groupby('Nome Completo')['Valor da Venda'].sum().nlargest(10).reset_index()
-    fig2 = px.bar(
-        top_clientes,
-        x='Valor da Venda', y='Nome Completo',
-        orientation='h',
-        title='Top 10 Clientes',
-        color_discrete_sequence=['#FF7F50'],
-        template='plotly_dark'
-    )
+    fig2 = {
+        'data': [{'type': 'bar', 'orientation': 'h',
+                  'x': top_clientes['Valor da Venda'].tolist(), 'y': top_clientes['Nome Completo'].tolist(),
+                  'marker': {'color': '#FF7F50'}}],
+        'layout': layout_grafico('Top 10 Clientes', 'Valor da Venda', 'Nome Completo')
+    }
 
     # Gráfico 3 - Top 10 Produtos
-    top_produtos = df.groupby('Produto')['Valor da Venda'].sum().nlargest(10).reset_index()
-    fig3 = px.line(
-        top_produtos,
-        x='Produto', y='Valor da Venda',
-        title='Top 10 Produtos',
-        markers=True,
-        color_discrete_sequence=['#32CD32'],
-        template='plotly_dark'
-    )
+    fig3 = {
+        'data': [{'type': 'scatter', 'mode': 'lines+markers',
+                  'x': top_produtos['Produto'].tolist(), 'y': top_produtos['Valor da Venda'].tolist(),
+                  'line': {'color': '#32CD32'}}],
+        'layout': layout_grafico('Top 10 Produtos', 'Produto', 'Valor da Venda')
+    }
 
     # Gráfico 4 - Vendas por Loja
-    vendas_lojas = df.groupby('Nome da Loja')['Valor da Venda'].sum().reset_index()
-    fig4 = px.bar(
-        vendas_lojas,
-        x='Nome da Loja', y='Valor da Venda',
-        title='Vendas por Loja',
-        color_discrete_sequence=['#FFD700'],
-        template='plotly_dark'
-    )
+    fig4 = {
+        'data': [{'type': 'bar',
+                  'x': vendas_lojas['Nome da Loja'].tolist(), 'y': vendas_lojas['Valor da Venda'].tolist(),
+                  'marker': {'color': '#FFD700'}}],
+        'layout': layout_grafico('Vendas por Loja', 'Nome da Loja', 'Valor da Venda')
+    }
 
     # Gráfico 5 - Distribuição por Tipo de Produto
-    fig5 = px.pie(
-        df,
-        names='Tipo do Produto', values='Valor da Venda',
-        title='Distribuição por Tipo de Produto',
-        color_discrete_sequence=px.colors.qualitative.Set3,
-        template='plotly_dark'
-    )
+    fig5 = {
+        'data': [{'type': 'pie',
+                  'labels': vendas_tipo['Tipo do Produto'].tolist(), 'values': vendas_tipo['Valor da Venda'].tolist()}],
+        'layout': {**layout_grafico('Distribuição por Tipo de Produto'), 'piecolorway': qualitative.Set3}
+    }
 
     # Gráfico 6 - Evolução Mensal de Vendas
-    df['Mês'] = df['Data da Venda'].dt.to_period('M').astype(str)
-    vendas_mes = df.groupby('Mês')['Valor da Venda'].sum().reset_index()
-    fig6 = px.area(
-        vendas_mes,
-        x='Mês', y='Valor da Venda',
-        title='Evolução Mensal de Vendas',
-        color_discrete_sequence=['#1E90FF'],
-        template='plotly_dark'
-    )
+    fig6 = {
+        'data': [{'type': 'scatter', 'mode': 'lines', 'stackgroup': '1',
+                  'x': vendas_mes['Mês'].tolist(), 'y': vendas_mes['Valor da Venda'].tolist(),
+                  'line': {'color': '#1E90FF'}}],
+        'layout': layout_grafico('Evolução Mensal de Vendas', 'Mês', 'Valor da Venda')
+    }
 
     return fig1, fig2, fig3, fig4, fig5, fig6
 